@@ -2,16 +2,20 @@ from flask import Flask, render_template, request, redirect, url_for
 from flask_socketio import SocketIO, join_room, emit
 import uuid
 import random
-from threading import Thread
-from time import sleep
+from collections import Counter, defaultdict, deque
+from contextlib import contextmanager
+from functools import lru_cache, wraps
+from threading import Lock
+
+try:
+    import orjson
+except ImportError:  # optional: fall back to the stdlib json encoder
+    orjson = None
 
 from game_logic.mahjong import (
     create_deck,
     shuffle_deck,
     deal_tiles,
-    can_claim_pong,
-    can_claim_chi,
-    can_claim_kong,
     Tile
 )
 
@@ -20,7 +24,21 @@ NGROK_DOMAIN = "sunbird-close-newt.ngrok-free.app"
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key'
-socketio = SocketIO(app, cors_allowed_origins="*")
+
+class OrjsonCodec:
+    """json-module shim so Socket.IO packets are encoded with orjson."""
+    @staticmethod
+    def dumps(obj, *args, **kwargs):
+        return orjson.dumps(obj).decode()
+
+    @staticmethod
+    def loads(s, *args, **kwargs):
+        return orjson.loads(s)
+
+socketio_options = {'cors_allowed_origins': "*"}
+if orjson is not None:
+    socketio_options['json'] = OrjsonCodec
+socketio = SocketIO(app, **socketio_options)
 
 # In-memory storage for game rooms and state.
 rooms = {}
@@ -30,8 +48,11 @@ TEST_MODE = False
 
 # Turn order
 POSITIONS = ["north", "east", "south", "west"]
+NEXT_POS = dict(zip(POSITIONS, POSITIONS[1:] + POSITIONS[:1]))
 
-def create_test_deck():
+@lru_cache(maxsize=1)
+def _test_deck_layout():
+    # The test deal is deterministic, so build it once and hand out copies.
     full_deck = create_deck()
     full_deck.sort(key=lambda t: t.id)
     # Remove two copies of tile id 5 for forcing a meld (e.g. for Pong)
@@ -51,83 +72,203 @@ def create_test_deck():
     east_hand[0] = Tile(5)
     east_hand[1] = Tile(5)
     players_hands = {
-         "north": north_hand + [north_extra],
-         "east": east_hand,
-         "south": south_hand,
-         "west": west_hand
+         "north": tuple(north_hand + [north_extra]),
+         "east": tuple(east_hand),
+         "south": tuple(south_hand),
+         "west": tuple(west_hand)
     }
-    remaining_deck = full_deck[53:]
-    return players_hands, remaining_deck
+    return players_hands, tuple(full_deck[53:])
+
+def create_test_deck():
+    hands, remaining = _test_deck_layout()
+    players_hands = {pos: list(hand) for pos, hand in hands.items()}
+    return players_hands, deque(remaining)
 
 def get_next_turn(current_turn: str) -> str:
-    idx = POSITIONS.index(current_turn)
-    return POSITIONS[(idx + 1) % len(POSITIONS)]
+    return NEXT_POS[current_turn]
 
-def update_hand_counts(room_id: str):
+def get_hand_counts(room_id: str) -> dict:
     room_data = rooms[room_id]
-    counts = {
+    return {
         pos: len(room_data["game_state"]["players_hands"].get(pos, []))
         for pos in POSITIONS
     }
-    socketio.emit('hand_update', {'hand_counts': counts}, room=room_id)
+
+def hand_counts_update(room_id: str):
+    """Return the hand_update payload, or None if counts are unchanged since last sent."""
+    room_data = rooms[room_id]
+    counts = get_hand_counts(room_id)
+    if counts == room_data.get("_last_counts"):
+        return None
+    room_data["_last_counts"] = counts
+    return {'hand_counts': counts}
+
+# Serialized tile dicts, keyed by tile id (name/suit/image never change).
+_tile_payloads = {}
+
+def tile_payload(tile) -> dict:
+    """Return the cached {id, name, suit, image_path} dict sent to clients."""
+    payload = _tile_payloads.get(tile.id)
+    if payload is None:
+        payload = _tile_payloads[tile.id] = {
+            'id': tile.id,
+            'name': tile.name,
+            'suit': tile.suit,
+            'image_path': tile.image_path
+        }
+    return payload
+
+def emit_state(room_id: str, **patches):
+    """Send room state changes as one 'state_update' frame, keyed by event name.
+
+    Every tile_discarded/turn_update/hand_update/meld_claimed/meld_update
+    broadcast goes through here, so clients only listen for one frame type.
+    """
+    patches = {event: data for event, data in patches.items() if data is not None}
+    if patches:
+        room_emit(room_id, 'state_update', patches, room=room_id)
+
+# --- Meld helpers ---
+def can_claim_pong_counts(counts, tile) -> bool:
+    """Pong check against a tile-id histogram of the hand."""
+    return counts[tile.id] >= 2
+
+def can_claim_kong_counts(counts, tile) -> bool:
+    """Kong check against a tile-id histogram of the hand."""
+    return counts[tile.id] >= 3
+
+def chi_partners_counts(counts, tile):
+    """Return the two hand tile ids that make a chi with tile, or None.
+
+    Works on a tile-id histogram; ids 0–26 are three suits of 1–9.
+    """
+    if tile.id > 26:
+        return None
+    number = tile.id % 9
+    for lo, hi in ((-2, -1), (-1, 1), (1, 2)):
+        if (0 <= number + lo and number + hi <= 8
+                and counts[tile.id + lo] and counts[tile.id + hi]):
+            return tile.id + lo, tile.id + hi
+    return None
+
+# --- Room locking ---
+def new_room_lock():
+    """Lock that excludes other handlers under the server's async mode."""
+    if socketio.async_mode == 'eventlet':
+        from eventlet.semaphore import Semaphore
+        return Semaphore()
+    if socketio.async_mode.startswith('gevent'):
+        from gevent.lock import Semaphore
+        return Semaphore()
+    return Lock()
+
+@contextmanager
+def room_lock(room_id: str):
+    """Hold the room's lock; emits queued with room_emit go out after release.
+
+    The room's send lock is taken before the state lock is let go and held
+    while the outbox is flushed, so batches from one room leave in the order
+    their handlers ran.
+
+    The lock is not reentrant: code already holding it calls the unlocked
+    helpers (e.g. _claim_meld) rather than the locked handlers.
+    """
+    room_data = rooms[room_id]
+    lock, send_lock = room_data["_lock"], room_data["_send_lock"]
+    with lock:
+        room_data["_outbox"] = outbox = []
+        try:
+            yield room_data
+        finally:
+            del room_data["_outbox"]
+        send_lock.acquire()
+    try:
+        for args, kwargs in outbox:
+            socketio.emit(*args, **kwargs)
+    finally:
+        send_lock.release()
+
+def room_emit(room_id: str, *args, **kwargs):
+    """socketio.emit, deferred until the room lock is released if it is held."""
+    outbox = rooms[room_id].get("_outbox")
+    if outbox is None:
+        socketio.emit(*args, **kwargs)
+    else:
+        outbox.append((args, kwargs))
+
+def with_room_lock(handler):
+    """Run a room event handler while holding that room's lock."""
+    @wraps(handler)
+    def wrapper(data):
+        if data['room'] not in rooms:
+            return handler(data)
+        with room_lock(data['room']):
+            return handler(data)
+    return wrapper
 
 # --- AI Helpers ---
 def schedule_ai_move(room_id: str):
-    """If the next turn belongs to a bot, fire off its move in a thread."""
+    """If the next turn belongs to a bot, fire off its move in a background task."""
     room_data = rooms[room_id]
     next_pos = room_data["game_state"]["current_turn"]
     # find the username at that position
-    next_user = next(u for u, p in room_data["positions"].items() if p == next_pos)
+    next_user = room_data["pos_to_user"][next_pos]
     if next_user in room_data["bots"]:
-        Thread(target=handle_ai_turn, args=(room_id, next_user)).start()
+        socketio.start_background_task(handle_ai_turn, room_id, next_user,
+                                       room_data["game_state"])
 
-def handle_ai_turn(room_id: str, bot_username: str):
+def handle_ai_turn(room_id: str, bot_username: str, game_state: dict):
     """Bot draws one tile, then discards via ai_discard_tile."""
-    sleep(1.5)  # give a slight pause
-    
-    room_data = rooms[room_id]
-    position = room_data["positions"][bot_username]
-    deck = room_data["game_state"]["remaining_deck"]
-     # Check if the bot can claim a meld
-    last_discard = room_data["game_state"].get("last_discard")
-    meld_claimed = False
-    if last_discard:
-          bot_hand = room_data["game_state"]["players_hands"][position]
-          can_claim_flag, _ = can_claim_chi(bot_hand, last_discard)
-          if can_claim_pong(bot_hand, last_discard):
-               on_claim_meld({
-                    'room': room_id,
-                    'username': bot_username,
-                    'meld_type': 'pong'
-               })
-               meld_claimed = True
-          elif can_claim_flag:
-               on_claim_meld({
-                    'room': room_id,
-                    'username': bot_username,
-                    'meld_type': 'chi'
-               })
-               meld_claimed = True
-          elif can_claim_kong(bot_hand, last_discard):
-               on_claim_meld({
-                    'room': room_id,
-                    'username': bot_username,
-                    'meld_type': 'kong'
-               })
-               meld_claimed = True
-               
-    if not deck:
-        scores, winner = settle_scores(room_id, None, 0)
-        socketio.emit('game_over',{'winner':winner,'score_table':scores,'reason':'draw—no tiles left'},room=room_id)
-        return
-    
-    if deck and not meld_claimed:
-        drawn = deck.pop(0)
-        room_data["game_state"]["players_hands"][position].append(drawn)
-        # update other players' view of hand counts
-        update_hand_counts(room_id)
-    # now discard
-    ai_discard_tile(room_id, bot_username)
+    socketio.sleep(1.5)  # give a slight pause
+
+    # one move at a time per room
+    with room_lock(room_id) as room_data:
+        position = room_data["positions"][bot_username]
+        # stale task: the game was restarted or the turn moved on (a claim)
+        if (room_data["game_state"] is not game_state
+                or game_state["current_turn"] != position):
+            return
+        deck = room_data["game_state"]["remaining_deck"]
+         # Check if the bot can claim a meld
+        last_discard = room_data["game_state"].get("last_discard")
+        meld_claimed = False
+        if last_discard:
+              bot_hand = room_data["game_state"]["players_hands"][position]
+              counts = Counter(t.id for t in bot_hand)
+              if can_claim_pong_counts(counts, last_discard):
+                   _claim_meld({
+                        'room': room_id,
+                        'username': bot_username,
+                        'meld_type': 'pong'
+                   })
+                   meld_claimed = True
+              elif chi_partners_counts(counts, last_discard):
+                   _claim_meld({
+                        'room': room_id,
+                        'username': bot_username,
+                        'meld_type': 'chi'
+                   })
+                   meld_claimed = True
+              elif can_claim_kong_counts(counts, last_discard):
+                   _claim_meld({
+                        'room': room_id,
+                        'username': bot_username,
+                        'meld_type': 'kong'
+                   })
+                   meld_claimed = True
+
+        if not deck:
+            scores, winner = settle_scores(room_id, None, 0)
+            room_emit(room_id, 'game_over',{'winner':winner,'score_table':scores,'reason':'draw—no tiles left'},room=room_id)
+            return
+
+        if deck and not meld_claimed:
+            drawn = deck.popleft()
+            room_data["game_state"]["players_hands"][position].append(drawn)
+            # update other players' view of hand counts
+            emit_state(room_id, hand_update=hand_counts_update(room_id))
+        # now discard
+        ai_discard_tile(room_id, bot_username)
 
 def ai_discard_tile(room_id: str, username: str):
     """Heuristic for medium‑level AI: discard tiles least useful for melds."""
@@ -147,33 +288,42 @@ def ai_discard_tile(room_id: str, username: str):
     
     # tile_to_discard = candidates[0] if candidates else hand[0]
 
-    # 2  Build a score for each tile
-    scores = {}
-    for t in hand:
-        s = 0
-        # 1) Pong potential
-        copies = sum(1 for x in hand if x.id == t.id) - 1
-        s += copies
+    # 2  Build a score for each distinct tile id (copies score the same)
+    # one histogram pass, so every lookup below is O(1)
+    id_counts = Counter(t.id for t in hand)
+    # Shortcut: a lone honor/bonus tile scores the minimum (-1) and outranks
+    # every suited tile on the highest-ID tie-break, so skip the scoring pass.
+    lone_honors = [tile_id for tile_id, n in id_counts.items() if tile_id > 26 and n == 1]
+    if lone_honors:
+        discard_id = max(lone_honors)
+    else:
+        scores = {}
+        for tile_id, n in id_counts.items():
+            s = 0
+            # 1) Pong potential
+            copies = n - 1
+            s += copies
 
-        # 2) Chow potential (suited only)
-        if 0 <= t.id <= 26:
-            for neighbor in (t.id - 2, t.id - 1, t.id + 1, t.id + 2):
-                if any(x.id == neighbor for x in hand):
-                    s += 1
+            # 2) Chow potential (suited only)
+            if 0 <= tile_id <= 26:
+                for neighbor in (tile_id - 2, tile_id - 1, tile_id + 1, tile_id + 2):
+                    if neighbor in id_counts:
+                        s += 1
 
-        # 3) Isolation penalty
-        if copies == 0 and not (0 <= t.id <= 26 and any(
-                abs(x.id - t.id) in (1,2) for x in hand)):
-            s -= 1
+            # 3) Isolation penalty
+            if copies == 0 and not (0 <= tile_id <= 26 and any(
+                    (tile_id + d) in id_counts for d in (-2, -1, 1, 2))):
+                s -= 1
 
-        scores[t] = s
+            scores[tile_id] = s
 
-    # Find the lowest‑scoring tile(s)
-    min_score = min(scores.values())
-    candidates = [t for t,sc in scores.items() if sc == min_score]
+        # Find the lowest‑scoring tile(s)
+        min_score = min(scores.values())
 
-    # Tie-breaker: pick the one with highest ID
-    tile_to_discard = max(candidates, key=lambda t: t.id)
+        # Tie-breaker: pick the one with highest ID
+        discard_id = max(tile_id for tile_id, sc in scores.items() if sc == min_score)
+
+    tile_to_discard = next(t for t in hand if t.id == discard_id)
 
     # 3) remove it and broadcast
     hand.remove(tile_to_discard)
@@ -182,32 +332,27 @@ def ai_discard_tile(room_id: str, username: str):
 
     emit_data = {
         'username': username,
-        'tile': {
-            'id': tile_to_discard.id,
-            'name': tile_to_discard.name,
-            'suit': tile_to_discard.suit,
-            'image_path': tile_to_discard.image_path
-        }
+        'tile': tile_payload(tile_to_discard)
     }
-    socketio.emit('tile_discarded', emit_data, room=room_id)
 
     # advance turn
     next_pos = get_next_turn(position)
     room_data["game_state"]["current_turn"] = next_pos
-    socketio.emit('turn_update', {'current_turn': next_pos}, room=room_id)
+    emit_state(room_id,
+               tile_discarded=emit_data,
+               turn_update={'current_turn': next_pos},
+               hand_update=hand_counts_update(room_id))
 
     # check win
     win, score = check_win_and_score(room_id, username)
     if win:
         new_scores, winner = settle_scores(room_id, username, score)
-        socketio.emit('game_over', {
+        room_emit(room_id, 'game_over', {
             'winner': winner,
             'score_table': new_scores,
             'reason': 'win'
         }, room=room_id)
 
-    update_hand_counts(room_id)
-
     # chain into next bot if needed
     schedule_ai_move(room_id)
 
@@ -224,10 +369,13 @@ def create_room_route():
         "human_players": [user],
         "bots": [],
         "positions": {},
+        "pos_to_user": {},
         "sids": {},
         "game_started": False,
         "game_state": {},
-        "scores": {}
+        "scores": {},
+        "_lock": new_room_lock(),
+        "_send_lock": new_room_lock()
     }
     return redirect(url_for('game', room_id=room_id) + '?username=' + user)
 
@@ -239,6 +387,7 @@ def game(room_id):
 
 # --- SocketIO handlers ---
 @socketio.on('join_room')
+@with_room_lock
 def on_join(data):
     room = data['room']
     user = data['username']
@@ -258,6 +407,7 @@ def on_join(data):
     # assign a position
     idx = len(room_data["positions"])
     room_data["positions"][user] = POSITIONS[idx]
+    room_data["pos_to_user"][POSITIONS[idx]] = user
 
     join_room(room)
     # tell everyone who's in (HUMANS only for now; bots show up at game start)
@@ -267,6 +417,7 @@ def on_join(data):
     }, room=room)
 
 @socketio.on('start_game')
+@with_room_lock
 def on_start_game(data):
     room = data['room']
     room_data = rooms.get(room)
@@ -287,6 +438,7 @@ def on_start_game(data):
         room_data["bots"].append(bot_name)
         idx = len(room_data["positions"])
         room_data["positions"][bot_name] = POSITIONS[idx]
+        room_data["pos_to_user"][POSITIONS[idx]] = bot_name
         room_data["sids"][bot_name] = None  # no real socket
 
     # build full participant list
@@ -299,8 +451,10 @@ def on_start_game(data):
           deck = create_deck()
           shuffle_deck(deck)
           hands, remaining = deal_tiles(deck)
+          remaining = deque(remaining)
 
     room_data["game_started"] = True
+    room_data["_last_counts"] = None
     room_data["game_state"] = {
         "players_hands": hands,
         "remaining_deck": remaining,
@@ -310,38 +464,31 @@ def on_start_game(data):
     }
     room_data["scores"] = {p: 2000 for p in participants}
 
-    # send each human their hand
-    for p in participants:
-        pos = room_data["positions"][p]
+    # send each human their hand (bots have no socket)
+    for p in humans:
         sid = room_data["sids"].get(p)
         if sid:
-            socketio.emit('deal_hand', {
-                'hand': [{
-                    'id': t.id, 'name': t.name,
-                    'suit': t.suit, 'image_path': t.image_path
-                } for t in hands[pos]],
+            pos = room_data["positions"][p]
+            room_emit(room, 'deal_hand', {
+                'hand': [tile_payload(t) for t in hands[pos]],
                 'position': pos
             }, room=sid)
 
     # announce start
-    socketio.emit('game_started', {
+    # (carries the full player list, now that bots are seated)
+    room_emit(room, 'game_started', {
         'message': 'Game has started!',
-        'current_turn': 'north'
-    }, room=room)
-    
-    # tell everyone who's in (HUMANS only for now; bots show up at game start)
-    emit('player_joined', {
-        'players': room_data["human_players"] + room_data['bots']
+        'current_turn': 'north',
+        'players': participants
     }, room=room)
 
-    
-    update_hand_counts(room)
+    emit_state(room, hand_update=hand_counts_update(room))
     # if north is a bot, let it play immediately
-    if next_u := next((u for u in room_data["bots"]
-                       if room_data["positions"][u] == "north"), None):
+    if room_data["pos_to_user"]["north"] in room_data["bots"]:
         schedule_ai_move(room)
 
 @socketio.on('draw_tile')
+@with_room_lock
 def on_draw_tile(data):
     room = data['room']
     user = data['username']
@@ -362,23 +509,17 @@ def on_draw_tile(data):
 
     # if not deck:
         # check for win or draw
-            win, score = settle_scores(room, user)
-            socketio.emit('game_over',{'winner':None,'score_table':rd["scores"],'reason':'draw—no tiles left'},room=rd["room"])
+            scores, winner = settle_scores(room)
+            room_emit(room, 'game_over',{'winner':winner,'score_table':scores,'reason':'draw—no tiles left'},room=room)
             return
-    tile = deck.pop(0)
+    tile = deck.popleft()
     rd["game_state"]["players_hands"][pos].append(tile)
 
     sid = rd["sids"].get(user)
     if sid:
-        socketio.emit('tile_drawn', {
-            'tile': {
-                'id': tile.id, 'name': tile.name,
-                'suit': tile.suit,
-                'image_path': tile.image_path
-            }
-        }, room=sid)
+        room_emit(room, 'tile_drawn', {'tile': tile_payload(tile)}, room=sid)
 
-    update_hand_counts(room)
+    emit_state(room, hand_update=hand_counts_update(room))
 
     # advance turn
 #     rd["game_state"]["current_turn"] = get_next_turn(pos)
@@ -387,6 +528,7 @@ def on_draw_tile(data):
 #     }, room=room)
 
 @socketio.on('discard_tile')
+@with_room_lock
 def on_discard_tile(data):
     room = data['room']
     user = data['username']
@@ -411,27 +553,18 @@ def on_discard_tile(data):
     rd["game_state"]["discard_pile"].append(tile)
     rd["game_state"]["last_discard"] = tile
 
-    socketio.emit('tile_discarded', {
-        'username': user,
-        'tile': {
-            'id': tile.id, 'name': tile.name,
-            'suit': tile.suit, 'image_path': tile.image_path
-        }
-    }, room=room)
-
     # advance turn
     rd["game_state"]["current_turn"] = get_next_turn(pos)
-    socketio.emit('turn_update', {
-        'current_turn': rd["game_state"]["current_turn"]
-    }, room=room)
-
-    update_hand_counts(room)
+    emit_state(room,
+               tile_discarded={'username': user, 'tile': tile_payload(tile)},
+               turn_update={'current_turn': rd["game_state"]["current_turn"]},
+               hand_update=hand_counts_update(room))
 
     # check human win
     win, score = check_win_and_score(room, user)
     if win:
-        new_scores = settle_scores(room, user, score)
-        socketio.emit('game_over', {
+        new_scores, _ = settle_scores(room, user, score)
+        room_emit(room, 'game_over', {
             'winner': user,
             'score_table': new_scores,
             "reason": 'win'
@@ -443,29 +576,48 @@ def on_discard_tile(data):
 
 # --- Other event handlers and logic ---
 # --- Simplified win–checking functions ---
+# Tile ids run 0–41 (suited 0–26, honors 27–33, bonus 34–41).
+NUM_TILE_IDS = 42
+
+# Sub-hand results for can_form_sets, keyed by the per-id count tuple.
+_can_form_sets_memo = {}
+
 def can_form_sets(tile_ids):
-    # Recursively check if tile_ids can be partitioned into sets (pung/chow).
-    if not tile_ids:
-         return True
-    first = tile_ids[0]
+    # Check if tile_ids can be partitioned into sets (pung/chow).
+    counts = [0] * NUM_TILE_IDS
+    for tile_id in tile_ids:
+         counts[tile_id] += 1
+    if len(_can_form_sets_memo) > 4096:
+         _can_form_sets_memo.clear()
+    return _can_form_sets_counts(counts)
+
+def _can_form_sets_counts(counts, start=0):
+    # Backtracks in place on one list (decrement, recurse, restore); each
+    # node's tuple(counts) keys the memo, so every sub-hand is solved once.
+    # Ids below start are already exhausted, so the scan resumes there.
+    key = tuple(counts)
+    found = _can_form_sets_memo.get(key)
+    if found is not None:
+         return found
+    first = next((i for i in range(start, len(counts)) if counts[i]), None)
+    found = first is None
     # Check for pung:
-    if tile_ids.count(first) >= 3:
-         new_ids = tile_ids.copy()
-         for _ in range(3):
-              new_ids.remove(first)
-         if can_form_sets(new_ids):
-              return True
-    # Check for chow (only for suited tiles, assume ids 0–26 are suited)
-    if first <= 26:
-         second, third = first+1, first+2
-         if second in tile_ids and third in tile_ids:
-              new_ids = tile_ids.copy()
-              new_ids.remove(first)
-              new_ids.remove(second)
-              new_ids.remove(third)
-              if can_form_sets(new_ids):
-                   return True
-    return False
+    if not found and counts[first] >= 3:
+         counts[first] -= 3
+         found = _can_form_sets_counts(counts, first)
+         counts[first] += 3
+    # Check for chow (suited ids 0–26, nine per suit; runs stay in one suit)
+    if (not found and first < 27 and first % 9 <= 6
+              and counts[first+1] and counts[first+2]):
+         counts[first] -= 1
+         counts[first+1] -= 1
+         counts[first+2] -= 1
+         found = _can_form_sets_counts(counts, first)
+         counts[first] += 1
+         counts[first+1] += 1
+         counts[first+2] += 1
+    _can_form_sets_memo[key] = found
+    return found
 
 def check_win_and_score(room, username):
     """
@@ -526,62 +678,50 @@ def settle_scores(room, winner=None, win_score=0):
         scores = {user: 2000 for user in room_data["positions"].keys()}
         room_data["scores"] = scores
 
-    # Calculate scores based on melds
-    player_scores = {}
-    for position, melds in room_data["game_state"]["players_melds"].items():
-        player_score = 0
-        for meld in melds:
-            if meld['meld_type'] == 'pong':
-                tile_id = meld['tiles'][0]['id']
-                player_score += 4 if tile_id in [0, 8] else 2
-            elif meld['meld_type'] == 'kong':
-                tile_id = meld['tiles'][0]['id']
-                player_score += 8 if tile_id in [0, 8] else 4
-            elif meld['meld_type'] == 'chi':
-                player_score += 1  # Assign 1 point for each chi meld
-        player_scores[position] = player_score
-
-    # Determine the winner based on the highest score
-    winner_position = max(player_scores, key=player_scores.get)
-    winner_score = player_scores[winner_position]
-    winner = next(user for user, pos in room_data["positions"].items() if pos == winner_position)
-
-    # Adjust scores: losers pay the winner
-    for user, position in room_data["positions"].items():
-        if user == winner:
-            for loser, loser_position in room_data["positions"].items():
-                if loser != winner:
-                    if winner_position == "east":
-                        scores[winner] += 2 * winner_score
-                        scores[loser] -= 2 * winner_score
-                    else:
-                        scores[winner] += winner_score
-                        scores[loser] -= winner_score
+    if winner is not None:
+        winner_position = room_data["positions"][winner]
+        winner_score = win_score
+    else:
+        # Draw: calculate scores based on melds (seats without melds score 0)
+        player_scores = {pos: 0 for pos in room_data["positions"].values()}
+        for position, melds in room_data["game_state"]["players_melds"].items():
+            player_score = 0
+            for meld in melds:
+                if meld['meld_type'] == 'pong':
+                    tile_id = meld['tiles'][0]['id']
+                    player_score += 4 if tile_id in [0, 8] else 2
+                elif meld['meld_type'] == 'kong':
+                    tile_id = meld['tiles'][0]['id']
+                    player_score += 8 if tile_id in [0, 8] else 4
+                elif meld['meld_type'] == 'chi':
+                    player_score += 1  # Assign 1 point for each chi meld
+            player_scores[position] = player_score
+
+        # Determine the winner based on the highest score
+        winner_position = max(player_scores, key=player_scores.get)
+        winner_score = player_scores[winner_position]
+        if winner_score == 0:
+            # nobody scored: a plain draw, no winner and no payments
+            return scores, None
+        winner = room_data["pos_to_user"][winner_position]
+
+    # Adjust scores: losers pay the winner (double if east wins)
+    multiplier = 2 if winner_position == "east" else 1
+    delta = multiplier * winner_score
+    for loser in room_data["positions"]:
+        if loser != winner:
+            scores[winner] += delta
+            scores[loser] -= delta
 
     return scores, winner
 
-def settle_scores_old(room, winner, win_score):
-    room_data = rooms[room]
-    scores = room_data.get("scores", {})
-    if not scores:
-         scores = {user: 2000 for user in room_data["players"]}
-         room_data["scores"] = scores
-    for user in room_data["players"]:
-         if user == winner:
-              for loser in room_data["players"]:
-                   if loser != winner:
-                        if room_data["positions"][winner] == "east":
-                             scores[winner] += 2 * win_score
-                             scores[loser] -= 2 * win_score
-                        else:
-                             scores[winner] += win_score
-                             scores[loser] -= win_score
-         # Losers pay the winner.
-    return scores
-
-
 @socketio.on('claim_meld')
+@with_room_lock
 def on_claim_meld(data):
+    _claim_meld(data)
+
+def _claim_meld(data):
+    """Body of on_claim_meld; the caller must hold the room lock."""
     room = data['room']
     username = data['username']
     meld_type = data['meld_type']
@@ -598,58 +738,40 @@ def on_claim_meld(data):
          emit('error', {'message': 'No tile available to claim.'})
          return
     hand = room_data["game_state"]["players_hands"].get(position, [])
+    # tile id -> indices in hand, shared by validation and extraction
+    by_id = defaultdict(list)
+    for i, t in enumerate(hand):
+         by_id[t.id].append(i)
+    counts = Counter({tile_id: len(idxs) for tile_id, idxs in by_id.items()})
     valid = False
-    meld_tiles = []
+    take = []
     if meld_type == 'pong':
-         if can_claim_pong(hand, last_discard):
+         if can_claim_pong_counts(counts, last_discard):
               valid = True
-              count = 0
-              for t in hand[:]:
-                   if t.id == last_discard.id and count < 2:
-                        meld_tiles.append(t)
-                        hand.remove(t)
-                        count += 1
+              take = by_id[last_discard.id][:2]
     elif meld_type == 'chi':
-         can_claim_flag, sequence = can_claim_chi(hand, last_discard)
-         if can_claim_flag:
+         partners = chi_partners_counts(counts, last_discard)
+         if partners:
               valid = True
-              needed_numbers = [n for n in sequence if n != int(last_discard.name.split()[1])]
-              for n in needed_numbers:
-                   for t in hand[:]:
-                        if t.suit == last_discard.suit and int(t.name.split()[1]) == n:
-                             meld_tiles.append(t)
-                             hand.remove(t)
-                             break
+              take = [by_id[tile_id][0] for tile_id in partners]
     elif meld_type == 'kong':
-         if can_claim_kong(hand, last_discard):
+         if can_claim_kong_counts(counts, last_discard):
               valid = True
-              count = 0
-              for t in hand[:]:
-                   if t.id == last_discard.id and count < 3:
-                        meld_tiles.append(t)
-                        hand.remove(t)
-                        count += 1
+              take = by_id[last_discard.id][:3]
     else:
          emit('error', {'message': 'Invalid meld type.'})
          return
     if not valid:
          emit('error', {'message': f"Cannot claim {meld_type} with the last discarded tile."})
          return
+    meld_tiles = [hand[i] for i in take]
+    for i in sorted(take, reverse=True):
+         hand.pop(i)
     if room_data["game_state"]["discard_pile"]:
          room_data["game_state"]["discard_pile"].pop()
     meld_info = {
          'meld_type': meld_type,
-         'tiles': [{
-              'id': last_discard.id,
-              'name': last_discard.name,
-              'suit': last_discard.suit,
-              'image_path': last_discard.image_path
-         }] + [{
-              'id': t.id,
-              'name': t.name,
-              'suit': t.suit,
-              'image_path': t.image_path
-         } for t in meld_tiles],
+         'tiles': [tile_payload(last_discard)] + [tile_payload(t) for t in meld_tiles],
          'claimed_by': username
     }
     if "players_melds" not in room_data["game_state"]:
@@ -658,30 +780,27 @@ def on_claim_meld(data):
          room_data["game_state"]["players_melds"][position] = []
     room_data["game_state"]["players_melds"][position].append(meld_info)
     room_data["game_state"]["current_turn"] = position
-    socketio.emit('meld_claimed', meld_info, room=room)
     # socketio.emit('turn_update', {'current_turn': position}, room=room)
-    update_hand_counts(room)
-    socketio.emit('meld_update', {'players_melds': room_data["game_state"]["players_melds"]}, room=room)
+    emit_state(room,
+               meld_claimed=meld_info,
+               hand_update=hand_counts_update(room),
+               meld_update={'players_melds': room_data["game_state"]["players_melds"]})
     
     # NEW: Send updated hand to the claiming player
     updated_hand = room_data["game_state"]["players_hands"][position]
     sid = room_data["sids"].get(username)
     if sid:
-         hand_data = [{
-              'id': tile.id,
-              'name': tile.name,
-              'suit': tile.suit,
-              'image_path': tile.image_path
-         } for tile in updated_hand]
-         socketio.emit('update_hand', {'hand': hand_data}, room=sid)
+         hand_data = [tile_payload(tile) for tile in updated_hand]
+         room_emit(room, 'update_hand', {'hand': hand_data}, room=sid)
     
     
     win, score = check_win_and_score(room, username)
     if win:
-         new_scores = settle_scores(room, username, score)
-         socketio.emit('game_over', {'winner': username, "reason": "win", 'score_table': new_scores}, room=room)
+         new_scores, _ = settle_scores(room, username, score)
+         room_emit(room, 'game_over', {'winner': username, "reason": "win", 'score_table': new_scores}, room=room)
 
 @socketio.on('check_meld')
+@with_room_lock
 def on_check_meld(data):
     room = data['room']
     username = data['username']
@@ -698,13 +817,13 @@ def on_check_meld(data):
          emit('meld_options', {'options': []}, room=request.sid)
          return
     hand = room_data["game_state"]["players_hands"].get(position, [])
+    counts = Counter(t.id for t in hand)
     options = []
-    if can_claim_pong(hand, last_discard):
+    if can_claim_pong_counts(counts, last_discard):
          options.append('pong')
-    can_claim_flag, _ = can_claim_chi(hand, last_discard)
-    if can_claim_flag:
+    if chi_partners_counts(counts, last_discard):
          options.append('chi')
-    if can_claim_kong(hand, last_discard):
+    if can_claim_kong_counts(counts, last_discard):
          options.append('kong')
     emit('meld_options', {'options': options}, room=request.sid)
 
@@ -713,7 +832,9 @@ def on_chat_message(data):
     room = data['room']
     username = data['username']
     message = data['message']
-    socketio.emit('chat_message', {'username': username, 'message': message}, room=room)
+    # the sender renders its own message locally, so don't echo it back
+    socketio.emit('chat_message', {'username': username, 'message': message},
+                  room=room, skip_sid=request.sid)
 
 
 